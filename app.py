@@ -1,5 +1,18 @@
+import time
+import uuid
+import queue
+import logging
+import threading
 import streamlit as st
-from main import app  
+from langchain_core.utils.json import parse_partial_json
+from main import app, thread_config, mark_thread_active, compact_checkpoints
+
+logging.getLogger().setLevel(logging.WARNING)   # Node progress logs are debug-only; keep them off in the app
+
+# Re-parsing the streamed JSON and re-rendering Markdown costs O(size), so do it at most this often
+RENDER_INTERVAL = 0.1
+# How long the UI waits on the event queue before yielding to Streamlit (reruns/Stop can interrupt then)
+EVENT_POLL_SECONDS = 0.5
 
 st.set_page_config(page_title="Agentic Researcher", layout="wide")
 
@@ -11,6 +24,8 @@ with st.sidebar:
     max_rev = st.number_input("Max Revisions", min_value=1, max_value=5, value=2)
     user_task = st.text_area("Research Topic:", height=150, 
         value="Research the latest advancements in Solid State Batteries in 2024.")
+    reuse_research = st.checkbox("Reuse cached research", value=True,
+        help="Skip planning and searching when this session researched the same topic recently.")
     run_btn = st.button("Start Research")
 
 if run_btn:
@@ -18,8 +33,14 @@ if run_btn:
         "task": user_task,
         "max_revisions": max_rev,
         "revision_number": 0,
-        "content": []
+        "critique": "",
+        "reuse_research": reuse_research
     }
+    # The session id lives in the URL, so it survives page refreshes and server restarts while
+    # keeping concurrent browser sessions on separate checkpoint threads
+    if "session" not in st.query_params:
+        st.query_params["session"] = uuid.uuid4().hex
+    config = thread_config(user_task, st.query_params["session"])
     
     col1, col2 = st.columns(2)
     with col1:
@@ -29,20 +50,119 @@ if run_btn:
         st.subheader("📝 Final Report")
         report_container = st.empty()
 
-    status_container.info("Initializing agents...")
+    heartbeat = status_container.empty()
+    heartbeat.info("Initializing agents...")
     
+    events = queue.Queue()
+
+    def run_graph(stop: threading.Event):
+        # Drive the graph off the UI thread so pipeline progress never waits on widget rendering
+        try:
+            mark_thread_active(config)
+            stream = app.stream(initial_state, config=config, stream_mode=["updates", "messages"])
+            for event in stream:
+                if stop.is_set():
+                    break   # The page was rerun or stopped; stop spending API quota
+                events.put(event)
+            stream.close()
+        except Exception as e:
+            events.put(e)
+        finally:
+            # Failed runs are compacted too; a stopped run may overlap the next run on this
+            # thread, so it leaves compaction to that run
+            if not stop.is_set():
+                try:
+                    compact_checkpoints(config)
+                except Exception as e:
+                    events.put(e)
+            events.put(None)
+
+    # A rerun starts a new run; wait for the previous one from this session to wind down first,
+    # since it writes checkpoints to the same thread
+    previous_stop = st.session_state.get("run_stop")
+    previous_worker = st.session_state.get("run_worker")
+    if previous_stop is not None:
+        previous_stop.set()
+    if previous_worker is not None and previous_worker.is_alive():
+        with st.spinner("Stopping the previous run..."):
+            previous_worker.join()
+    stop = threading.Event()
+    worker = threading.Thread(target=run_graph, args=(stop,), daemon=True)
+    st.session_state["run_stop"] = stop
+    st.session_state["run_worker"] = worker
+    worker.start()
+    started = time.monotonic()
+
     try:
-        for step in app.stream(initial_state):
+        live_draft = ""
+        live_critique = ""
+        critic_preview = None
+        last_render = 0.0
+        node_panels = {}   # One reusable slot per agent instead of a new expander each step
+
+        while True:
+            try:
+                event = events.get(timeout=EVENT_POLL_SECONDS)
+            except queue.Empty:
+                # Touching a widget gives Streamlit a chance to interrupt this loop on rerun/Stop
+                heartbeat.caption(f"Running... {time.monotonic() - started:.0f}s")
+                continue
+            if event is None:
+                break
+            if isinstance(event, Exception):
+                raise event
+
+            mode, payload = event
+            if mode == "messages":
+                # Token-level events: render the draft as it is written
+                chunk, metadata = payload
+                node = metadata.get("langgraph_node")
+                if node == "writer":
+                    live_draft += chunk.content
+                elif node == "critic":
+                    live_critique += chunk.content
+
+                # The final render happens on the node's "updates" event
+                now = time.monotonic()
+                if now - last_render < RENDER_INTERVAL:
+                    continue
+                last_render = now
+
+                if node == "writer":
+                    # The writer answers in JSON; show the partial "draft" field as it grows
+                    partial = parse_partial_json(live_draft) if live_draft.strip() else None
+                    if isinstance(partial, dict) and isinstance(partial.get("draft"), str):
+                        report_container.markdown(partial["draft"])
+                elif node == "critic":
+                    # Inspect the critic's JSON before the closing brace arrives
+                    partial = parse_partial_json(live_critique) if live_critique.strip() else None
+                    if isinstance(partial, dict) and "score" in partial:
+                        if critic_preview is None:
+                            critic_preview = status_container.empty()
+                        critic_preview.caption(f"Critic scoring... {partial['score']}/100 {partial.get('status', '')}")
+                continue
+
+            step = payload
             for node_name, node_state in step.items():
-                
-                with status_container:
+                if node_name == "writer":
+                    live_draft = ""
+                elif node_name == "critic":
+                    live_critique = ""
+                    if critic_preview is not None:
+                        critic_preview.empty()
+                        critic_preview = None
+
+                if node_name not in node_panels:
+                    node_panels[node_name] = status_container.empty()
+
+                with node_panels[node_name].container():
                     with st.expander(f"Agent: {node_name.upper()}", expanded=True):
                         if node_name == "planner":
                             st.write(f"**Plan:** {node_state.get('plan')}")
                         elif node_name == "researcher":
                             st.write(f"**Found Data:** {len(node_state.get('content', []))} sources.")
                         elif node_name == "writer":
-                            st.write("**Drafting Report...**")
+                            st.write(f"**Draft {node_state.get('revision_number')}** (self-score: {node_state.get('self_score')}/100)")
                             st.code(node_state.get('draft')[:500] + "...", language="markdown")
                         elif node_name == "critic":
                             critique = node_state.get('critique')
@@ -54,5 +174,10 @@ if run_btn:
                 if 'draft' in node_state:
                     report_container.markdown(node_state['draft'])
 
+        heartbeat.empty()
+
     except Exception as e:
-        st.error(f"An error occurred: {e}")
\ No newline at end of file
+        st.error(f"An error occurred: {e}")
+    finally:
+        # Also runs when Streamlit interrupts the script, so the worker stops at its next event
+        stop.set()
\ No newline at end of file
@@ -0,0 +1,49 @@
+import re
+import ast
+import json
+from typing import Any
+import orjson
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_JSON_LITERALS = {"true": True, "false": False, "null": None}
+
+
+class _JsonLiteralNames(ast.NodeTransformer):
+    """Turns bare true/false/null names into constants; string contents are left untouched."""
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id in _JSON_LITERALS:
+            return ast.copy_location(ast.Constant(_JSON_LITERALS[node.id]), node)
+        return node
+
+
+def parse_fuzzy_json(text: str) -> Any:
+    """Parses LLM JSON that may be fenced, use Python literals or carry trailing commas."""
+    fenced = _FENCE_RE.fullmatch(text.strip())   # Only a fence wrapping the whole reply
+    if fenced:
+        text = fenced.group(1)
+    text = text.strip()
+
+    candidates = [text]
+    start, end = text.find("{"), text.rfind("}")
+    if 0 <= start < end and (start, end) != (0, len(text) - 1):
+        candidates.append(text[start:end + 1])  # Drop prose around the outermost object
+
+    for candidate in candidates:
+        try:
+            return orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            pass
+        # Models often emit raw newlines/tabs inside long string values (e.g. a Markdown draft)
+        try:
+            return json.loads(candidate, strict=False)
+        except json.JSONDecodeError:
+            pass
+        # Python literal syntax tolerates single quotes, True/None and trailing commas
+        try:
+            tree = _JsonLiteralNames().visit(ast.parse(candidate, mode="eval"))
+            return ast.literal_eval(tree)
+        except (ValueError, SyntaxError, TypeError, RecursionError):
+            pass
+
+    raise ValueError(f"Could not parse JSON from LLM response: {text[:200]}")
@@ -1,19 +1,32 @@
 import os
-import json
+import time
+import sqlite3
+import hashlib
 import logging
-from typing import TypedDict, List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import TypedDict, List, Dict, Any, Optional, Set, Tuple
+import httpx
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.utils.json import parse_partial_json
 from langgraph.graph import StateGraph, END
-from tavily import TavilyClient
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from json_utils import parse_fuzzy_json
+from research_utils import canonical_url, select_top_snippets
 
 # --- CONFIGURATION ---
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Research (cached searches and checkpointed content) older than this is redone; idle threads are deleted too
+RESEARCH_TTL_SECONDS = 6 * 60 * 60
+
 # --- STATE DEFINITION ---
 class AgentState(TypedDict):
     task: str
@@ -24,40 +37,158 @@ class AgentState(TypedDict):
     revision_number: int
     max_revisions: int
     error_log: List[str]        # New: Track errors for debugging
+    self_score: int             # Writer's own grade; high scores skip the critic
+    researched_at: float        # Epoch seconds when content was gathered
+    reuse_research: bool        # Input flag: allow fresh checkpointed research to skip planner/researcher
 
 # --- SETUP TOOLS & LLM ---
-llm = ChatOpenAI(
-    model="openai/gpt-oss-20b:free",
+# One pooled HTTP client shared by every LLM client, so revisions reuse warm TLS connections
+openrouter_http = httpx.Client(timeout=httpx.Timeout(120.0, connect=10.0))
+
+# The planner prompt asks for 3 queries; this also bounds researcher threads and Tavily calls
+MAX_PLAN_QUERIES = 3
+
+# Constrained decoding: providers that support json_schema can only emit these shapes
+PLANNER_SCHEMA = {
+    "name": "research_plan",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "queries": {
+                "type": "array",
+                "items": {"type": "string"},
+                "minItems": 1,
+                "maxItems": MAX_PLAN_QUERIES,
+            }
+        },
+        "required": ["queries"],
+        "additionalProperties": False,
+    },
+}
+
+CRITIC_SCHEMA = {
+    "name": "critique",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "score": {"type": "integer"},
+            "status": {"type": "string", "enum": ["APPROVE", "REJECT"]},
+            "feedback": {"type": "string"},
+        },
+        "required": ["score", "status", "feedback"],
+        "additionalProperties": False,
+    },
+}
+
+# Planner and critic only emit small structured JSON, so they are routed to smaller models
+planner_llm = ChatOpenAI(
+    model="meta-llama/llama-3.1-8b-instruct:free",
     api_key=os.environ["OPENROUTER_API_KEY"],
     base_url="https://openrouter.ai/api/v1",
+    http_client=openrouter_http,
     temperature=0.2,            # Lower temp for more deterministic logic
-    model_kwargs={"response_format": {"type": "json_object"}} # Force JSON where possible
+    model_kwargs={"response_format": {"type": "json_schema", "json_schema": PLANNER_SCHEMA}}
 )
 
-tavily = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
+critic_llm = ChatOpenAI(
+    model="mistralai/mistral-7b-instruct:free",
+    api_key=os.environ["OPENROUTER_API_KEY"],
+    base_url="https://openrouter.ai/api/v1",
+    http_client=openrouter_http,
+    temperature=0.2,
+    model_kwargs={"response_format": {"type": "json_schema", "json_schema": CRITIC_SCHEMA}}
+)
+
+WRITER_SCHEMA = {
+    "name": "report",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "draft": {"type": "string"},
+            "self_score": {"type": "integer"},
+        },
+        "required": ["draft", "self_score"],
+        "additionalProperties": False,
+    },
+}
+
+# The writer keeps the larger model (Markdown report, warmer temperature)
+writer_llm = ChatOpenAI(
+    model="openai/gpt-oss-20b:free",
+    api_key=os.environ["OPENROUTER_API_KEY"],
+    base_url="https://openrouter.ai/api/v1",
+    http_client=openrouter_http,
+    temperature=0.4,
+    model_kwargs={"response_format": {"type": "json_schema", "json_schema": WRITER_SCHEMA}}
+)
+
+# Talk to Tavily's REST API over one keep-alive HTTP/2 pool shared by the parallel searches
+tavily_http = httpx.Client(
+    base_url="https://api.tavily.com",
+    headers={"Authorization": f"Bearer {os.environ['TAVILY_API_KEY']}"},
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=8),
+    timeout=httpx.Timeout(30.0, connect=10.0),
+)
+
+def tavily_search(query: str, **params: Any) -> Dict[str, Any]:
+    response = tavily_http.post("/search", json={"query": query, **params})
+    response.raise_for_status()
+    return response.json()
 
 # --- ROBUST UTILITIES ---
 
+MAX_SNIPPET_CHARS = 600   # Tavily snippets can run 1-2KB; trim before they reach the writer prompt
+
+def max_results_for(query: str) -> int:
+    """Short queries read as broad topics and get an extra result; narrow ones get 2."""
+    return 3 if len(query.split()) <= 3 else 2
+
+def fetch_search_results(query: str, max_results: int = 2, use_cache: bool = True) -> Tuple[Tuple[str, str], ...]:
+    """Normalizes the query so repeated searches are served from the cache (unless use_cache is off)."""
+    query = " ".join(query.split()).lower()
+    if not use_cache:
+        return _search(query, max_results)
+    # The time bucket in the key expires cached results after at most RESEARCH_TTL_SECONDS
+    return _cached_search(query, max_results, int(time.time() // RESEARCH_TTL_SECONDS))
+
+@lru_cache(maxsize=512)
+def _cached_search(query: str, max_results: int, ttl_bucket: int) -> Tuple[Tuple[str, str], ...]:
+    """Only successful results are cached; failures raise."""
+    return _search(query, max_results)
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def safe_search(query: str) -> str:
+def _search(query: str, max_results: int) -> Tuple[Tuple[str, str], ...]:
     """Retries search 3 times if it fails."""
     try:
-        results = tavily.search(query=query, max_results=3)
-        if not results.get('results'):
-            return f"No results found for query: {query}"
-        
-        # Deduplicate and format
-        context = ""
-        seen_urls = set()
-        for res in results['results']:
-            if res['url'] not in seen_urls:
-                context += f"Source: {res['url']}\nSnippet: {res['content']}\n\n"
-                seen_urls.add(res['url'])
-        return context
+        results = tavily_search(query, max_results=max_results, include_raw_content=False)
+        return tuple(
+            (res['url'], res['content'][:MAX_SNIPPET_CHARS]) for res in results.get('results', [])
+        )
     except Exception as e:
-        logger.error(f"Search failed: {e}")
+        logger.error("Search failed: %s", e)
         raise e  # Tenacity will catch this and retry
 
+def format_search_results(query: str, results: Tuple[Tuple[str, str], ...], seen: Optional[Set[str]] = None) -> str:
+    """Formats results for the writer, skipping URLs already in `seen` (shared across queries)."""
+    if not results:
+        return f"No results found for query: {query}"
+    if seen is None:
+        seen = set()
+
+    # Deduplicate and format
+    parts = []
+    for url, snippet in results:
+        key = canonical_url(url)
+        if key in seen:
+            continue
+        seen.add(key)
+        parts.append(f"Source: {url}\nSnippet: {snippet}")
+    return "\n\n".join(parts)
+
 # --- PROMPT ENGINEERING ---
 
 PLANNER_PROMPT = """
@@ -86,6 +217,13 @@ INSTRUCTIONS:
 2. Synthesize the research. Do not just list facts; tell a story.
 3. If the research is missing information, state "Data not found" for that section.
 4. Cite sources using [URL] format.
+
+OUTPUT FORMAT:
+Return valid JSON only:
+{{
+    "draft": "The full Markdown report",
+    "self_score": (integer 0-100, how strictly a Chief Editor would grade this report)
+}}
 """
 
 CRITIC_PROMPT = """
@@ -105,66 +243,91 @@ Return valid JSON only:
 }
 """
 
+# Templates are parsed once here. The planner/critic system prompts contain literal JSON
+# braces, so they are passed as fixed messages rather than format strings.
+PLANNER_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessage(content=PLANNER_PROMPT),
+    ("human", "{task}"),
+])
+WRITER_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", WRITER_PROMPT),
+    ("human", "Write the report."),
+])
+CRITIC_TEMPLATE = ChatPromptTemplate.from_messages([
+    SystemMessage(content=CRITIC_PROMPT),
+    ("human", "Task: {task}\n\nDraft:\n{draft}"),
+])
+
+# Drafts the writer grades at or above this go straight to END without a critic call
+SELF_APPROVE_SCORE = 90
+
 # --- AGENT NODES ---
 
 def planner_node(state: AgentState):
-    print("---PLANNER: Strategizing---")
-    messages = [
-        SystemMessage(content=PLANNER_PROMPT),
-        HumanMessage(content=state['task'])
-    ]
+    logger.debug("---PLANNER: Strategizing---")
+    messages = PLANNER_TEMPLATE.format_messages(task=state['task'])
     try:
-        response = llm.invoke(messages)
-        plan_json = json.loads(response.content)
-        return {"plan": plan_json.get("queries", [state['task']])}
+        response = planner_llm.invoke(messages)
+        plan_json = parse_fuzzy_json(response.content)
+        # Providers may ignore the schema, so enforce the plan shape and size here too
+        queries = plan_json.get("queries") if isinstance(plan_json, dict) else None
+        if not isinstance(queries, list):
+            queries = []
+        queries = [q.strip() for q in queries if isinstance(q, str) and q.strip()]
+        return {"plan": queries[:MAX_PLAN_QUERIES] or [state['task']]}
     except Exception as e:
-        logger.error(f"Planner JSON error: {e}")
+        logger.error("Planner JSON error: %s", e)
         return {"plan": [state['task']], "error_log": [str(e)]}
 
 def researcher_node(state: AgentState):
-    print("---RESEARCHER: Executing Plan---")
-    content_results = []
-    
-    for query in state['plan']:
-        print(f"  --> Searching: {query}")
-        result = safe_search(query)
-        content_results.append(result)
-        
-    return {"content": content_results}
+    logger.debug("---RESEARCHER: Executing Plan---")
+    plan = list(dict.fromkeys(state['plan']))   # Drop repeated queries, keep order
+    for query in plan:
+        logger.debug("  --> Searching: %s", query)
+
+    # Searches are network-bound, so fan them out; map() preserves plan order
+    with ThreadPoolExecutor(max_workers=max(min(len(plan), MAX_PLAN_QUERIES), 1)) as executor:
+        fetch = partial(fetch_search_results, use_cache=state.get('reuse_research', True))
+        fetched = list(executor.map(fetch, plan, map(max_results_for, plan)))
+
+    # Format in plan order so the first query to surface a URL keeps it
+    seen = set()
+    content_results = [format_search_results(query, results, seen) for query, results in zip(plan, fetched)]
+
+    return {"content": content_results, "researched_at": time.time()}
 
 def writer_node(state: AgentState):
-    print("---WRITER: Drafting---")
-    full_content = "\n\n".join(state['content'])
-    
-    writer_llm = ChatOpenAI(
-        model="openai/gpt-oss-20b:free",
-        api_key=os.environ["OPENROUTER_API_KEY"],
-        base_url="https://openrouter.ai/api/v1",
-        temperature=0.4 
+    logger.debug("---WRITER: Drafting---")
+    full_content = select_top_snippets(state['content'], state['task'])
+
+    messages = WRITER_TEMPLATE.format_messages(
+        content=full_content,
+        critique=state.get('critique', 'None')
     )
-    
-    messages = [
-        SystemMessage(content=WRITER_PROMPT.format(
-            content=full_content, 
-            critique=state.get('critique', 'None')
-        )),
-        HumanMessage(content="Write the report.")
-    ]
-    response = writer_llm.invoke(messages)
+    # Stream tokens so graph consumers (stream_mode="messages") can render the draft as it grows
+    raw = "".join(chunk.content for chunk in writer_llm.stream(messages))
+    try:
+        report = parse_fuzzy_json(raw)
+        draft, self_score = report["draft"], int(report.get("self_score", 0))
+    except Exception as e:
+        # Salvage the draft field from truncated/malformed JSON; only fall back to raw text if there is none
+        logger.error("Writer JSON error: %s", e)
+        partial = parse_partial_json(raw) if raw.strip() else None
+        has_draft = isinstance(partial, dict) and isinstance(partial.get("draft"), str)
+        draft, self_score = (partial["draft"] if has_draft else raw), 0
+
     return {
-        "draft": response.content,
+        "draft": draft,
+        "self_score": self_score,
         "revision_number": state.get("revision_number", 1) + 1
     }
 
 def critic_node(state: AgentState):
-    print("---CRITIC: Reviewing---")
-    messages = [
-        SystemMessage(content=CRITIC_PROMPT),
-        HumanMessage(content=f"Task: {state['task']}\n\nDraft:\n{state['draft']}")
-    ]
+    logger.debug("---CRITIC: Reviewing---")
+    messages = CRITIC_TEMPLATE.format_messages(task=state['task'], draft=state['draft'])
     try:
-        response = llm.invoke(messages)
-        critique_json = json.loads(response.content)
+        response = critic_llm.invoke(messages)
+        critique_json = parse_fuzzy_json(response.content)
         
         feedback_msg = f"Score: {critique_json['score']}/100. Feedback: {critique_json['feedback']}"
         status = critique_json['status']
@@ -172,24 +335,40 @@ def critic_node(state: AgentState):
         return {"critique": f"{status}: {feedback_msg}"}
         
     except Exception as e:
-        logger.error(f"Critic parsing error: {e}")
+        logger.error("Critic parsing error: %s", e)
         return {"critique": "REJECT: System Error in Critique formatting. Please refine style."}
 
 
+def route_start(state: AgentState):
+    # Fresh research checkpointed for this thread is reused instead of re-planning/searching
+    research_age = time.time() - state.get('researched_at', 0)
+    if state.get('reuse_research', True) and state.get('content') and research_age < RESEARCH_TTL_SECONDS:
+        logger.debug("---RESUME: Reusing checkpointed research---")
+        return "writer"
+    return "planner"
+
+
+def route_draft(state: AgentState):
+    if state.get('self_score', 0) >= SELF_APPROVE_SCORE:
+        logger.debug("---DECISION: SELF-APPROVED (Skipping critic)---")
+        return END
+    return "critic"
+
+
 def should_continue(state: AgentState):
     critique = state['critique']
     revision_number = state['revision_number']
     max_revisions = state['max_revisions']
 
     if "APPROVE" in critique:
-        print("---DECISION: APPROVE---")
+        logger.debug("---DECISION: APPROVE---")
         return END
     
     if revision_number > max_revisions:
-        print("---DECISION: MAX REVISIONS REACHED---")
+        logger.debug("---DECISION: MAX REVISIONS REACHED---")
         return END
     
-    print(f"---DECISION: REJECT (Score too low)---")
+    logger.debug("---DECISION: REJECT (Score too low)---")
     return "writer"
 
 
@@ -199,27 +378,65 @@ workflow.add_node("researcher", researcher_node)
 workflow.add_node("writer", writer_node)
 workflow.add_node("critic", critic_node)
 
-workflow.set_entry_point("planner")
+workflow.set_conditional_entry_point(route_start, {"planner": "planner", "writer": "writer"})
 
 workflow.add_edge("planner", "researcher")
 workflow.add_edge("researcher", "writer")
-workflow.add_edge("writer", "critic")
+workflow.add_conditional_edges("writer", route_draft, {END: END, "critic": "critic"})
 workflow.add_conditional_edges("critic", should_continue, {END: END, "writer": "writer"})
 
-app = workflow.compile()
+# Persist graph state per session and task so plan/content survive across runs and restarts
+checkpointer = SqliteSaver(sqlite3.connect("state.db", check_same_thread=False))
+app = workflow.compile(checkpointer=checkpointer)
+
+def thread_config(task: str, session_id: str = "cli") -> Dict[str, Any]:
+    """Graph config whose thread_id is stable for the same session and (normalized) task.
+
+    Separate sessions get separate threads, so concurrent runs never write to the same one.
+    """
+    task_hash = hashlib.sha256(" ".join(task.split()).lower().encode()).hexdigest()[:16]
+    return {"configurable": {"thread_id": f"{session_id}:{task_hash}"}}
+
+_THREAD_ACTIVITY_TABLE = "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, updated_at REAL)"
+
+def mark_thread_active(config: Dict[str, Any]) -> None:
+    """Records a run starting on a thread, so the thread expires even if the run never finishes."""
+    with checkpointer.cursor() as cur:
+        cur.execute(_THREAD_ACTIVITY_TABLE)
+        cur.execute("INSERT OR REPLACE INTO thread_activity VALUES (?, ?)", (config["configurable"]["thread_id"], time.time()))
+
+def compact_checkpoints(config: Dict[str, Any]) -> None:
+    """Keeps only the latest checkpoint of a run (finished or failed) and deletes threads idle past the TTL."""
+    thread_id = config["configurable"]["thread_id"]
+    now = time.time()
+    latest = "SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ?"
+    with checkpointer.cursor() as cur:
+        cur.execute(_THREAD_ACTIVITY_TABLE)
+        for table in ("writes", "checkpoints"):
+            cur.execute(f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_id < ({latest})", (thread_id, thread_id))
+        cur.execute("INSERT OR REPLACE INTO thread_activity VALUES (?, ?)", (thread_id, now))
+        cur.execute("SELECT thread_id FROM thread_activity WHERE updated_at < ?", (now - RESEARCH_TTL_SECONDS,))
+        stale = [row[0] for row in cur.fetchall()]
+        cur.executemany("DELETE FROM thread_activity WHERE thread_id = ?", [(t,) for t in stale])
+
+    for stale_thread in stale:
+        checkpointer.delete_thread(stale_thread)
 
 if __name__ == "__main__":
+    logger.setLevel(logging.DEBUG)   # Show node progress when run from the CLI
     task = "Analyze the impact of AI on Junior Developer jobs in 2025."
     initial_state = {
         "task": task,
         "max_revisions": 2,
         "revision_number": 0,
-        "content": [],
-        "plan": [],
-        "draft": "",
         "critique": "",
         "error_log": []
     }
-    
-    result = app.invoke(initial_state)
+    # plan/content are left out so a checkpointed run of the same task keeps its research
+    config = thread_config(task)
+    mark_thread_active(config)
+    try:
+        result = app.invoke(initial_state, config=config)
+    finally:
+        compact_checkpoints(config)
     print("\nFINAL REPORT:\n", result['draft'])
\ No newline at end of file
@@ -0,0 +1,55 @@
+import re
+from collections import Counter
+from typing import List
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import numpy as np
+
+CHARS_PER_TOKEN = 4       # Rough English average; good enough for budgeting prompt size
+# Safety cap on writer research context; normal runs (<= 9 trimmed snippets, ~1.5k tokens) fit whole
+WRITER_CONTEXT_TOKENS = 3000
+
+
+def canonical_url(url: str) -> str:
+    """Lowercases scheme/host and drops tracking params and fragments so near-duplicates match."""
+    parts = urlsplit(url.strip())
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith("utm_")])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), query, ""))
+
+
+_SNIPPET_SPLIT_RE = re.compile(r"\n\n(?=Source: )")
+_WORD_RE = re.compile(r"\w+")
+
+
+def bm25_scores(docs: List[List[str]], query: List[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """Okapi BM25 score of each tokenized doc against the query terms.
+
+    Builds a (docs x query terms) term-frequency matrix so scoring is one batched dot product.
+    """
+    terms = list(dict.fromkeys(query))
+    counts = [Counter(doc) for doc in docs]
+    tf = np.array([[c[t] for t in terms] for c in counts], dtype=np.float32).reshape(len(docs), len(terms))
+    doc_len = np.array([len(doc) for doc in docs], dtype=np.float32)
+    doc_freq = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((len(docs) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+    norm = k1 * (1 - b + b * doc_len / (doc_len.mean() or 1.0))
+    return (tf * (k1 + 1) / (tf + norm[:, None])) @ idf
+
+
+def select_top_snippets(content: List[str], task: str, budget: int = WRITER_CONTEXT_TOKENS) -> str:
+    """Keeps the snippets most relevant to the task (BM25) that fit within an estimated token budget."""
+    snippets = [s.strip() for block in content for s in _SNIPPET_SPLIT_RE.split(block) if s.strip()]
+    if not snippets:
+        return ""
+
+    scores = bm25_scores([_WORD_RE.findall(s.lower()) for s in snippets], _WORD_RE.findall(task.lower()))
+    ranked = np.argsort(-scores, kind="stable")
+    token_counts = [len(snippet) // CHARS_PER_TOKEN + 1 for snippet in snippets]
+
+    kept, used = set(), 0
+    for i in ranked:
+        if used + token_counts[i] <= budget:
+            kept.add(i)
+            used += token_counts[i]
+
+    # Preserve research order so snippets from the same query stay together
+    return "\n\n".join(snippets[i] for i in sorted(kept))
@@ -0,0 +1,42 @@
+import pytest
+
+from json_utils import parse_fuzzy_json
+
+
+def test_plain_json():
+    assert parse_fuzzy_json('{"queries": ["a", "b"]}') == {"queries": ["a", "b"]}
+
+
+def test_fenced_json_with_trailing_commas():
+    text = '```json\n{"score": 80, "status": "REJECT", "feedback": "More data",}\n```'
+    assert parse_fuzzy_json(text) == {"score": 80, "status": "REJECT", "feedback": "More data"}
+
+
+def test_python_literals_and_single_quotes():
+    text = "{'ok': True, 'missing': None, 'done': false, 'items': [1, 2,],}"
+    assert parse_fuzzy_json(text) == {"ok": True, "missing": None, "done": False, "items": [1, 2]}
+
+
+def test_literal_words_inside_strings_are_preserved():
+    text = '{"feedback": "null hypothesis is true, not false", "valid": true,}'
+    assert parse_fuzzy_json(text) == {"feedback": "null hypothesis is true, not false", "valid": True}
+
+
+def test_prose_around_object():
+    text = 'Here is the plan:\n{"queries": ["q1"],}\nHope this helps!'
+    assert parse_fuzzy_json(text) == {"queries": ["q1"]}
+
+
+def test_code_fence_inside_draft_is_kept():
+    text = '{"draft": "## Code\\n```python\\nprint(1)\\n```", "self_score": 80}'
+    assert parse_fuzzy_json(text)["draft"] == "## Code\n```python\nprint(1)\n```"
+
+
+def test_unparseable_raises():
+    with pytest.raises(ValueError):
+        parse_fuzzy_json("not json at all")
+
+
+def test_raw_newlines_inside_draft_string():
+    text = '{"draft": "## Report\nline1\n\tline2", "self_score": 92}'
+    assert parse_fuzzy_json(text) == {"draft": "## Report\nline1\n\tline2", "self_score": 92}
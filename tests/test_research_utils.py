@@ -0,0 +1,59 @@
+import math
+
+import pytest
+
+from research_utils import bm25_scores, canonical_url, select_top_snippets
+
+
+def test_bm25_matches_hand_computed_scores():
+    docs = [["a", "b"], ["c"], ["a", "a", "d"]]
+    scores = bm25_scores(docs, ["a"])
+
+    # N=3, df(a)=2, avgdl=2, k1=1.5, b=0.75
+    idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+    doc0 = idf * 1 * 2.5 / (1 + 1.5 * (0.25 + 0.75 * 2 / 2))
+    doc2 = idf * 2 * 2.5 / (2 + 1.5 * (0.25 + 0.75 * 3 / 2))
+    assert scores.tolist() == pytest.approx([doc0, 0.0, doc2], rel=1e-5)
+    assert scores[2] > scores[0] > scores[1]
+
+
+def test_bm25_without_query_terms_scores_zero():
+    assert bm25_scores([["a"], ["b"]], []).tolist() == [0.0, 0.0]
+
+
+def test_select_top_snippets_keeps_relevant_within_budget_in_research_order():
+    content = [
+        "Source: http://a\nSnippet: solid state battery density\n\nSource: http://b\nSnippet: pasta recipes",
+        "Source: http://c\nSnippet: solid state battery costs",
+    ]
+    selected = select_top_snippets(content, "solid state battery", budget=30)
+    assert selected == (
+        "Source: http://a\nSnippet: solid state battery density\n\n"
+        "Source: http://c\nSnippet: solid state battery costs"
+    )
+
+
+def test_select_top_snippets_keeps_everything_under_budget():
+    content = ["Source: http://a\nSnippet: one\n\nSource: http://b\nSnippet: two", "No results found for query: x"]
+    selected = select_top_snippets(content, "anything")
+    assert selected.split("\n\n") == [
+        "Source: http://a\nSnippet: one",
+        "Source: http://b\nSnippet: two",
+        "No results found for query: x",
+    ]
+
+
+def test_select_top_snippets_empty():
+    assert select_top_snippets([], "task") == ""
+
+
+def test_canonical_url_drops_utm_params_and_fragment():
+    assert canonical_url("https://example.com/a?utm_source=x&id=2&UTM_Medium=y#frag") == "https://example.com/a?id=2"
+
+
+def test_canonical_url_lowercases_scheme_and_host_only():
+    assert canonical_url("HTTPS://Example.COM/Path") == "https://example.com/Path"
+
+
+def test_canonical_url_ignores_trailing_slash():
+    assert canonical_url("https://example.com/a/") == canonical_url("https://example.com/a")